@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from waifuc.action import BatchTaggingAction, TagDropAction, TagFilterAction, TagPostprocessAction, \
+    TagRemoveUnderlineAction
+from waifuc.action._tag_kernels import _threshold_rows_numpy, threshold_rows
+from waifuc.action.tagging import _BATCH_TAGGING_METHODS, DanbooruTagProcessAction
+from waifuc.model import ImageItem
+
+
+@pytest.fixture()
+def image():
+    yield Image.new('RGB', (16, 16), (255, 255, 255))
+
+
+def _item(image, tags=None, **meta):
+    if tags is not None:
+        meta['tags'] = tags
+    return ImageItem(image, meta)
+
+
+@pytest.mark.unittest
+class TestActionTagging:
+    def test_threshold_rows(self):
+        scores = np.array([
+            [0.9, 0.2, 0.95, 0.1],
+            [0.4, 0.8, 0.05, 0.99],
+        ], dtype=np.float32)
+        general_mask = np.array([True, True, False, False])
+        character_mask = np.array([False, False, True, True])
+
+        rows, cols = threshold_rows(scores, 0.35, 0.85, general_mask, character_mask)
+        assert list(zip(rows.tolist(), cols.tolist())) == [(0, 0), (0, 2), (1, 0), (1, 1), (1, 3)]
+
+    def test_threshold_rows_matches_numpy(self):
+        # trivially true without numba; checks kernel parity when installed
+        rng = np.random.default_rng(0)
+        scores = rng.random((4, 64), dtype=np.float32)
+        general_mask = rng.random(64) < 0.5
+        character_mask = ~general_mask
+
+        expected_rows, expected_cols = _threshold_rows_numpy(scores, 0.35, 0.85, general_mask, character_mask)
+        rows, cols = threshold_rows(scores, 0.35, 0.85, general_mask, character_mask)
+        np.testing.assert_array_equal(rows, expected_rows)
+        np.testing.assert_array_equal(cols, expected_cols)
+
+    def test_tag_postprocess_noop_returns_same_item(self, image):
+        item = _item(image, tags={'1girl': 0.9})
+        assert TagPostprocessAction(drop_tags={'solo'}).process(item) is item
+        assert TagPostprocessAction(remove_underline=True).process(item) is item
+
+    def test_tag_postprocess_fused(self, image):
+        item = _item(image, tags={'long_hair': 0.9, 'bad_tag': 0.7, 'solo': 0.5})
+        result = TagPostprocessAction(remove_underline=True, drop_tags={'bad_tag'}).process(item)
+        assert result.meta['tags'] == {'long hair': 0.9, 'solo': 0.5}
+
+    def test_tag_drop(self, image):
+        item = _item(image, tags={'1girl': 0.9, 'solo': 0.8})
+        result = TagDropAction(['solo']).process(item)
+        assert result.meta['tags'] == {'1girl': 0.9}
+        # the original item stays untouched
+        assert item.meta['tags'] == {'1girl': 0.9, 'solo': 0.8}
+
+    def test_tag_remove_underline(self, image):
+        item = _item(image, tags={'long_hair': 0.9, 'long hair': 0.95, 'solo': 0.5})
+        result = TagRemoveUnderlineAction().process(item)
+        # colliding tags keep the highest score
+        assert result.meta['tags'] == {'long hair': 0.95, 'solo': 0.5}
+
+    def test_danbooru_tag_process(self, image, tmp_path):
+        item = _item(
+            image,
+            tags={'1girl': 0.9, 'highres': 0.5, 'translated': 0.4, 'some_artist': 1.0},
+            danbooru={
+                'tag_string_meta': 'highres translated',
+                'tag_string_character': 'megumin',
+                'tag_string_copyright': 'konosuba',
+                'tag_string_artist': 'some_artist',
+                'rating': 'e',
+            },
+            filename='a/b.png',
+        )
+        result = DanbooruTagProcessAction(meta_whitelist=['highres'], output_dir=str(tmp_path)).process(item)
+
+        tags = result.meta['tags']
+        assert tags['highres'] == 0
+        assert 'translated' not in tags
+        assert tags['megumin'] == 2.9
+        assert tags['konosuba'] == 2.8
+        assert tags['@some_artist'] == 2.7
+        assert 'some_artist' not in tags
+        assert tags['explicit'] == 0
+        assert (tmp_path / 'a' / 'b_meta.json').exists()
+
+    def test_tag_filter_short_circuit(self, image):
+        action = TagFilterAction(['1girl'])
+        item = _item(image, tags={'1girl': 0.9})
+        assert list(action.iter(item)) == [item]
+        assert list(action.iter(_item(image, tags={'solo': 0.9}))) == []
+
+    def test_tag_filter_reversed(self, image):
+        action = TagFilterAction(['nsfw'], reversed=True)
+        item = _item(image, tags={'1girl': 0.9})
+        assert list(action.iter(item)) == [item]
+        assert list(action.iter(_item(image, tags={'nsfw': 0.9}))) == []
+
+    def test_batch_tagging_batches_and_order(self, image, monkeypatch):
+        calls = []
+
+        def _stub_tagging(images, **kwargs):
+            calls.append(len(images))
+            return [{'stub': 1.0} for _ in images]
+
+        monkeypatch.setitem(_BATCH_TAGGING_METHODS, 'stub', _stub_tagging)
+        action = BatchTaggingAction(method='stub', batch_size=3)
+
+        items = [_item(image, idx=i) for i in range(7)]
+        items[2] = _item(image, tags={'existing': 1.0}, idx=2)
+        results = list(action.iter_from(iter(items)))
+
+        assert [item.meta['idx'] for item in results] == list(range(7))
+        # pre-tagged items never reach the tagger, partial batches still flush
+        assert calls == [2, 3, 1]
+        assert results[2].meta['tags'] == {'existing': 1.0}
+        assert results[0].meta['tags'] == {'stub': 1.0}
+
+    def test_batch_tagging_dedup(self, image, monkeypatch):
+        tagged_images = []
+
+        def _stub_tagging(images, **kwargs):
+            tagged_images.extend(images)
+            return [{'stub': 1.0} for _ in images]
+
+        monkeypatch.setitem(_BATCH_TAGGING_METHODS, 'stub', _stub_tagging)
+        action = BatchTaggingAction(method='stub', batch_size=4, dedup_batch=True)
+
+        results = list(action.iter_from(iter([_item(image.copy()) for _ in range(4)])))
+        assert len(tagged_images) == 1
+        assert all(item.meta['tags'] == {'stub': 1.0} for item in results)
+
+        # identical pixels are also remembered across batches
+        results = list(action.iter_from(iter([_item(image.copy())])))
+        assert len(tagged_images) == 1
+        assert results[0].meta['tags'] == {'stub': 1.0}
@@ -14,5 +14,5 @@ from .head import HeadCoverAction, HeadCutOutAction
 from .lpips import FilterSimilarAction
 from .safety import SafetyAction
 from .split import PersonSplitAction, ThreeStageSplitAction
-from .tagging import TaggingAction, TagFilterAction, TagOverlapDropAction, TagDropAction, BlacklistedTagDropAction, \
-    TagRemoveUnderlineAction
+from .tagging import TaggingAction, BatchTaggingAction, TagFilterAction, TagPostprocessAction, TagOverlapDropAction, \
+    TagDropAction, BlacklistedTagDropAction, TagRemoveUnderlineAction
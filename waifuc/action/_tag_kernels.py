@@ -0,0 +1,57 @@
+import numpy as np
+
+try:
+    # shipped as the 'numba' extra (pip install waifuc[numba])
+    from numba import njit, prange
+    _HAS_NUMBA = True
+except (ImportError, ModuleNotFoundError):
+    njit, prange = None, None
+    _HAS_NUMBA = False
+
+
+def _threshold_rows_numpy(scores: np.ndarray, general_threshold: float, character_threshold: float,
+                          general_mask: np.ndarray, character_mask: np.ndarray):
+    keep = ((scores >= general_threshold) & general_mask[None, :]) | \
+           ((scores >= character_threshold) & character_mask[None, :])
+    return np.nonzero(keep)
+
+
+if _HAS_NUMBA:
+    @njit(parallel=True, cache=True)
+    def _threshold_rows_numba(scores, general_threshold, character_threshold,
+                              general_mask, character_mask):  # pragma: no cover
+        n_rows, n_cols = scores.shape
+
+        # first pass counts survivors per row so the output can be written
+        # in parallel without synchronization
+        counts = np.zeros(n_rows + 1, dtype=np.int64)
+        for r in prange(n_rows):
+            kept = 0
+            for j in range(n_cols):
+                score = scores[r, j]
+                if (general_mask[j] and score >= general_threshold) or \
+                        (character_mask[j] and score >= character_threshold):
+                    kept += 1
+            counts[r + 1] = kept
+
+        offsets = np.cumsum(counts)
+        rows = np.empty(offsets[-1], dtype=np.int64)
+        cols = np.empty(offsets[-1], dtype=np.int64)
+        for r in prange(n_rows):
+            k = offsets[r]
+            for j in range(n_cols):
+                score = scores[r, j]
+                if (general_mask[j] and score >= general_threshold) or \
+                        (character_mask[j] and score >= character_threshold):
+                    rows[k] = r
+                    cols[k] = j
+                    k += 1
+        return rows, cols
+
+
+def threshold_rows(scores: np.ndarray, general_threshold: float, character_threshold: float,
+                   general_mask: np.ndarray, character_mask: np.ndarray):
+    if _HAS_NUMBA:
+        return _threshold_rows_numba(np.ascontiguousarray(scores), general_threshold, character_threshold,
+                                     general_mask, character_mask)
+    return _threshold_rows_numpy(scores, general_threshold, character_threshold, general_mask, character_mask)
@@ -1,18 +1,163 @@
-from functools import partial
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+import hashlib
+import logging
 import os
-from typing import Iterator, Union, List, Mapping, Literal
+import tempfile
+import threading
+from typing import Iterable, Iterator, Union, List, Mapping, Literal
 
+import numpy as np
 from PIL import Image
-from imgutils.tagging import get_deepdanbooru_tags, get_wd14_tags, get_mldanbooru_tags, drop_overlap_tags, \
-    is_blacklisted, remove_underline
-from imgutils.validate import anime_rating
+from imgutils.data import load_image
+from imgutils.tagging import get_deepdanbooru_tags, drop_overlap_tags, is_blacklisted, remove_underline
+from imgutils.tagging.mldanbooru import _get_mldanbooru_labels
+from imgutils.tagging.wd14 import MODEL_NAMES as _WD14_MODEL_REPOS, MODEL_FILENAME as _WD14_MODEL_FILENAME, \
+    _get_wd14_labels
+from imgutils.utils import get_onnx_provider
+from huggingface_hub import hf_hub_download
+import onnxruntime
+from imgutils.generic.classify import _open_models_for_repo_id
 from imgutils.metrics import anime_dbaesthetic
+from ._tag_kernels import threshold_rows
 from .base import ProcessAction, BaseAction
 from ..model import ImageItem
 import json
 from pathlib import Path
 
 
+_WD14_MODEL_NAMES = {
+    'wd14_vit': 'ViT',
+    'wd14_convnext': 'ConvNext',
+    'wd14_convnextv2': 'ConvNextV2',
+    'wd14_swinv2': 'SwinV2',
+    'wd14_moat': 'MOAT',
+    'wd14_v3_swinv2': 'SwinV2_v3',
+    'wd14_v3_convnext': 'ConvNext_v3',
+    'wd14_v3_vit': 'ViT_v3',
+    'wd14_v3_eva02_large': 'EVA02_Large',
+    'wd14_v3_vit_large': 'ViT_Large',
+}
+
+
+TaggingPrecisionTyping = Literal['fp32', 'fp16', 'int8']
+
+
+_DEVICE_ALIASES = {
+    'cuda': 'CUDAExecutionProvider',
+    'gpu': 'CUDAExecutionProvider',
+    'dml': 'DmlExecutionProvider',
+    'directml': 'DmlExecutionProvider',
+    'cpu': 'CPUExecutionProvider',
+}
+
+
+def _resolve_providers(device: str = 'auto') -> list:
+    if device == 'auto' and os.environ.get('ONNX_MODE'):
+        device = get_onnx_provider(os.environ['ONNX_MODE'])
+    if device == 'auto':
+        available = onnxruntime.get_available_providers()
+        if 'CUDAExecutionProvider' in available:
+            device = 'cuda'
+        elif 'DmlExecutionProvider' in available:
+            device = 'dml'
+        else:
+            device = 'cpu'
+
+    provider = _DEVICE_ALIASES.get(device.lower(), device)
+    if provider == 'CUDAExecutionProvider':
+        return [
+            ('CUDAExecutionProvider', {
+                'device_id': 0,
+                'cudnn_conv_algo_search': 'EXHAUSTIVE',
+                'cudnn_conv_use_max_workspace': '1',
+                'arena_extend_strategy': 'kSameAsRequested',
+            }),
+            'CPUExecutionProvider',
+        ]
+    elif provider == 'CPUExecutionProvider':
+        return ['CPUExecutionProvider']
+    else:
+        return [provider, 'CPUExecutionProvider']
+
+
+def _open_session(model_path: str, device: str = 'auto') -> onnxruntime.InferenceSession:
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # batch shapes vary between full and trailing partial batches; memory
+    # patterns would record one arena layout per distinct shape and never
+    # release it, so RSS keeps growing on long pipelines
+    options.enable_mem_pattern = False
+    options.enable_cpu_mem_arena = True
+    options.add_session_config_entry('session.use_device_allocator_for_initializers', '1')
+
+    providers = _resolve_providers(device)
+    if providers[0] == 'CPUExecutionProvider':
+        options.intra_op_num_threads = os.cpu_count()
+    session = onnxruntime.InferenceSession(model_path, options, providers=providers)
+    # make silent CPU fallbacks visible
+    logging.info(f'Model {model_path!r} loaded with providers {session.get_providers()!r}')
+    return session
+
+
+def _quantize_model(model_path: str, precision: str) -> str:
+    # fp16 conversion needs onnx + onnxconverter-common, shipped as the
+    # 'quant' extra (pip install waifuc[quant]); converted models are cached
+    # on disk next to the downloaded fp32 graph
+    root, ext = os.path.splitext(model_path)
+    quantized_path = f'{root}.{precision}{ext}'
+    if not os.path.exists(quantized_path):
+        # convert into a temp file in the same directory and move it into
+        # place atomically, so an interrupted conversion never leaves a
+        # truncated graph at the final path
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(quantized_path), suffix=ext)
+        os.close(fd)
+        try:
+            if precision == 'int8':
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+            else:
+                import onnx
+                from onnxconverter_common import float16
+                model = onnx.load(model_path)
+                # keep_io_types leaves the input/output in float32, so the
+                # preprocessing and postprocessing paths stay unchanged
+                onnx.save(float16.convert_float_to_float16(model, keep_io_types=True), tmp_path)
+            os.replace(tmp_path, quantized_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return quantized_path
+
+
+@lru_cache(maxsize=None)
+def _get_wd14_session(model_name: str, precision: str = 'fp32', device: str = 'auto'):
+    # imgutils' own caches may evict; pinning the session and labels here for
+    # the process lifetime avoids silent multi-hundred-ms model reloads
+    model_path = hf_hub_download(_WD14_MODEL_REPOS[model_name], _WD14_MODEL_FILENAME)
+    if precision != 'fp32':
+        model_path = _quantize_model(model_path, precision)
+    return _open_session(model_path, device), _get_wd14_labels(model_name)
+
+
+@lru_cache(maxsize=None)
+def _get_wd14_label_arrays(model_name: str):
+    tag_names, _, general_indexes, character_indexes = _get_wd14_labels(model_name)
+    names = np.array(tag_names, dtype=object)
+    general_mask = np.zeros(len(tag_names), dtype=bool)
+    general_mask[general_indexes] = True
+    character_mask = np.zeros(len(tag_names), dtype=bool)
+    character_mask[character_indexes] = True
+    return names, general_mask, character_mask
+
+
+@lru_cache(maxsize=None)
+def _get_mldanbooru_session(device: str = 'auto'):
+    model_path = hf_hub_download('deepghs/ml-danbooru-onnx', 'ml_caformer_m36_dec-5-97527.onnx')
+    return _open_session(model_path, device), _get_mldanbooru_labels()
+
+
 def _deepdanbooru_tagging(image: Image.Image, use_real_name: bool = False,
                           general_threshold: float = 0.5, character_threshold: float = 0.5, **kwargs):
     _ = kwargs
@@ -21,36 +166,142 @@ def _deepdanbooru_tagging(image: Image.Image, use_real_name: bool = False,
 
 
 def _wd14_tagging(image: Image.Image, model_name: str,
-                  general_threshold: float = 0.35, character_threshold: float = 0.85, **kwargs):
+                  general_threshold: float = 0.35, character_threshold: float = 0.85,
+                  precision: TaggingPrecisionTyping = 'fp32', device: str = 'auto', **kwargs):
     _ = kwargs
-    _, features, characters = get_wd14_tags(
-        image,
-        model_name=model_name,
-        general_threshold=general_threshold,
-        character_threshold=character_threshold,
-    )
-    return {**features, **characters}
+    tags, = _wd14_batch_tagging([image], model_name, general_threshold, character_threshold,
+                                precision=precision, device=device)
+    return tags
 
 
-def _mldanbooru_tagging(image: Image.Image, use_real_name: bool = False, general_threshold: float = 0.7, **kwargs):
+def _mldanbooru_tagging(image: Image.Image, use_real_name: bool = False, general_threshold: float = 0.7,
+                        device: str = 'auto', **kwargs):
     _ = kwargs
-    features = get_mldanbooru_tags(image, use_real_name, general_threshold)
-    return features
+    tags, = _mldanbooru_batch_tagging([image], use_real_name, general_threshold, device=device)
+    return tags
 
 
 _TAGGING_METHODS = {
     'deepdanbooru': _deepdanbooru_tagging,
-    'wd14_vit': partial(_wd14_tagging, model_name='ViT'),
-    'wd14_convnext': partial(_wd14_tagging, model_name='ConvNext'),
-    'wd14_convnextv2': partial(_wd14_tagging, model_name='ConvNextV2'),
-    'wd14_swinv2': partial(_wd14_tagging, model_name='SwinV2'),
-    'wd14_moat': partial(_wd14_tagging, model_name='MOAT'),
-    'wd14_v3_swinv2': partial(_wd14_tagging, model_name='SwinV2_v3'),
-    'wd14_v3_convnext': partial(_wd14_tagging, model_name='ConvNext_v3'),
-    'wd14_v3_vit': partial(_wd14_tagging, model_name='ViT_v3'),
-    'wd14_v3_eva02_large': partial(_wd14_tagging, model_name='EVA02_Large'),
-    'wd14_v3_vit_large': partial(_wd14_tagging, model_name='ViT_Large'),
     'mldanbooru': _mldanbooru_tagging,
+    **{method: partial(_wd14_tagging, model_name=name) for method, name in _WD14_MODEL_NAMES.items()},
+}
+
+def _preprocess_batch(images: List[Image.Image], size: int, pad_square: bool = True,
+                      background: str = None) -> np.ndarray:
+    # One preallocated uint8 buffer for the whole batch, so the float cast /
+    # normalization below runs as a single vectorized pass instead of B times.
+    buffer = np.empty((len(images), size, size, 3), dtype=np.uint8)
+    for i, image in enumerate(images):
+        image = load_image(image, force_background=background, mode='RGB')
+        if pad_square and image.size[0] != image.size[1]:
+            max_dim = max(image.size)
+            padded_image = Image.new('RGB', (max_dim, max_dim), (255, 255, 255))
+            padded_image.paste(image, ((max_dim - image.size[0]) // 2, (max_dim - image.size[1]) // 2))
+            image = padded_image
+        if image.size != (size, size):
+            image = image.resize((size, size), Image.BICUBIC if pad_square else Image.BILINEAR)
+        buffer[i] = np.asarray(image, dtype=np.uint8)
+    return buffer
+
+
+def _wd14_batch_tagging(images: List[Image.Image], model_name: str,
+                        general_threshold: float = 0.35, character_threshold: float = 0.85,
+                        precision: TaggingPrecisionTyping = 'fp32', device: str = 'auto',
+                        **kwargs) -> List[dict]:
+    _ = kwargs
+    model, _labels = _get_wd14_session(model_name, precision, device)
+    names, general_mask, character_mask = _get_wd14_label_arrays(model_name)
+    input_ = model.get_inputs()[0]
+    # wd14 graphs consume NHWC directly, so the PIL-native HWC layout is kept
+    # end to end and no transpose is ever paid
+    if input_.shape[-1] != 3:
+        raise RuntimeError(f'Model {model_name!r} expected to take NHWC input, '
+                           f'but its input shape is {input_.shape!r}.')
+    _, size, _, _ = input_.shape
+    input_name = input_.name
+    label_name = model.get_outputs()[0].name
+
+    # wd14 models consume BGR float32 without normalization; the astype on the
+    # flipped view fuses the RGB->BGR swap and the cast into one traversal,
+    # and lands contiguous in NHWC
+    batch = np.ascontiguousarray(
+        _preprocess_batch(images, size, background='white')[:, :, :, ::-1].astype(np.float32))
+    preds = model.run([label_name], {input_name: batch})[0]
+
+    # the whole (B, N) score matrix is thresholded in one compiled pass (numba
+    # when available, vectorized numpy otherwise) instead of B * N Python-level
+    # checks; the csv orders general labels before character labels, so per-row
+    # column order matches the old output
+    rows, cols = threshold_rows(preds, general_threshold, character_threshold, general_mask, character_mask)
+    results = [{} for _ in range(len(images))]
+    for row, col, score in zip(rows.tolist(), cols.tolist(), preds[rows, cols].tolist()):
+        results[row][names[col]] = score
+    return results
+
+
+def _mldanbooru_batch_tagging(images: List[Image.Image], use_real_name: bool = False,
+                              general_threshold: float = 0.7, device: str = 'auto', **kwargs) -> List[dict]:
+    _ = kwargs
+    model, _ = _get_mldanbooru_session(device)
+    tags = _get_mldanbooru_labels(use_real_name)
+
+    # fixed 448x448 shape keeps the tensors stackable; normalize the whole
+    # batch in one np.multiply into a preallocated float buffer
+    arr = _preprocess_batch(images, 448, pad_square=False, background='white')
+    float_buffer = np.empty(arr.shape, dtype=np.float32)
+    np.multiply(arr, 1 / 255., out=float_buffer)
+    batch = np.ascontiguousarray(float_buffer.transpose(0, 3, 1, 2))
+    native_output, = model.run(['output'], {'input': batch})
+    output = 1 / (1 + np.exp(-native_output))
+
+    results = []
+    for row in output.reshape(output.shape[0], -1):
+        # match the baseline's (-score, name) ordering so caption order in
+        # downstream exports stays stable
+        pairs = [(tags[i], float(ratio)) for i, ratio in enumerate(row) if ratio >= general_threshold]
+        pairs.sort(key=lambda x: (-x[1], x[0]))
+        results.append(dict(pairs))
+    return results
+
+
+_RATING_REPO_ID = 'deepghs/anime_rating'
+_RATING_MODEL_NAME = 'mobilenetv3_v1_pruned_ls0.1'
+
+
+@lru_cache(maxsize=None)
+def _get_rating_session(device: str = 'auto'):
+    model_path = hf_hub_download(_RATING_REPO_ID, f'{_RATING_MODEL_NAME}/model.onnx')
+    labels = _open_models_for_repo_id(_RATING_REPO_ID)._open_label(_RATING_MODEL_NAME)
+    if isinstance(labels, dict):
+        # newer imgutils returns labels grouped as {'default': [...]}
+        labels = labels['default']
+    return _open_session(model_path, device), list(labels)
+
+
+def _batch_rating(images: List[Image.Image], device: str = 'auto') -> List[tuple]:
+    model, labels = _get_rating_session(device)
+    _, _, height, _ = model.get_inputs()[0].shape
+    size = height if isinstance(height, int) else 384
+
+    # classify models consume NCHW normalized with mean/std 0.5, i.e. x / 127.5 - 1
+    arr = _preprocess_batch(images, size, pad_square=False, background='white')
+    float_buffer = np.empty(arr.shape, dtype=np.float32)
+    np.multiply(arr, 1 / 127.5, out=float_buffer)
+    np.subtract(float_buffer, 1.0, out=float_buffer)
+    batch = np.ascontiguousarray(float_buffer.transpose(0, 3, 1, 2))
+
+    output, = model.run(['output'], {'input': batch})
+    results = []
+    for row in output:
+        max_id = int(np.argmax(row))
+        results.append((labels[max_id], float(row[max_id])))
+    return results
+
+
+_BATCH_TAGGING_METHODS = {
+    'mldanbooru': _mldanbooru_batch_tagging,
+    **{method: partial(_wd14_batch_tagging, model_name=name) for method, name in _WD14_MODEL_NAMES.items()},
 }
 
 TaggingMethodTyping = Literal[
@@ -61,10 +312,13 @@ TaggingMethodTyping = Literal[
 DEFAULT_TAGGING_METHOD: TaggingMethodTyping = 'wd14_v3_eva02_large'
 
 class TaggingAction(ProcessAction):
-    def __init__(self, method: TaggingMethodTyping = DEFAULT_TAGGING_METHOD, force: bool = False, **kwargs):
+    def __init__(self, method: TaggingMethodTyping = DEFAULT_TAGGING_METHOD, force: bool = False,
+                 precision: TaggingPrecisionTyping = 'fp32', device: str = 'auto', **kwargs):
         self.method = _TAGGING_METHODS[method]
         self.force = force
-        self.kwargs = kwargs
+        # sessions are loaded lazily on first inference and pinned by the
+        # lru_cache'd factories, so building the action stays cheap and offline
+        self.kwargs = {'precision': precision, 'device': device, **kwargs}
 
     def process(self, item: ImageItem) -> ImageItem:
         if 'tags' in item.meta and not self.force:
@@ -74,6 +328,100 @@ class TaggingAction(ProcessAction):
             return ImageItem(item.image, {**item.meta, 'tags': tags})
 
 
+class BatchTaggingAction(ProcessAction):
+    _DEDUP_CACHE_SIZE = 4096
+
+    def __init__(self, method: TaggingMethodTyping = DEFAULT_TAGGING_METHOD, force: bool = False,
+                 batch_size: int = 8, max_workers: int = 0, dedup_batch: bool = False,
+                 precision: TaggingPrecisionTyping = 'fp32', device: str = 'auto', **kwargs):
+        if method not in _BATCH_TAGGING_METHODS:
+            raise ValueError(f'Batched tagging not supported for method {method!r}.')
+        self.method = _BATCH_TAGGING_METHODS[method]
+        self.force = force
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.dedup_batch = dedup_batch
+        self.kwargs = {'precision': precision, 'device': device, **kwargs}
+        self._dedup_cache = {}
+        # _tag_images runs concurrently on executor threads when max_workers
+        # is set, so every access to the shared cache is lock-guarded
+        self._dedup_lock = threading.Lock()
+
+    def _tag_images(self, images: List[Image.Image]) -> List[dict]:
+        if not self.dedup_batch:
+            return self.method(images=images, **self.kwargs)
+
+        # web-scraped sets often repeat the exact same image; run inference on
+        # unique pixels only and scatter the results back, remembering recent
+        # results across batches
+        keys = [(image.mode, image.size, hashlib.sha1(image.tobytes()).digest()) for image in images]
+        local = {}
+        pending = {}
+        with self._dedup_lock:
+            for key, image in zip(keys, images):
+                if key in self._dedup_cache:
+                    local[key] = self._dedup_cache[key]
+                elif key not in pending:
+                    pending[key] = image
+        if pending:
+            # inference happens outside the lock; the batch is answered from
+            # the local dict so concurrent evictions can never drop a key
+            # between insertion and readback
+            for key, tags in zip(pending, self.method(images=list(pending.values()), **self.kwargs)):
+                local[key] = tags
+            with self._dedup_lock:
+                for key in pending:
+                    self._dedup_cache[key] = local[key]
+                while len(self._dedup_cache) > self._DEDUP_CACHE_SIZE:
+                    del self._dedup_cache[next(iter(self._dedup_cache))]
+        return [local[key] for key in keys]
+
+    def _tag_batch(self, items: List[ImageItem]) -> List[ImageItem]:
+        untagged = [i for i, item in enumerate(items) if self.force or 'tags' not in item.meta]
+        if untagged:
+            tags_list = self._tag_images([items[i].image for i in untagged])
+            for i, tags in zip(untagged, tags_list):
+                items[i] = ImageItem(items[i].image, {**items[i].meta, 'tags': tags})
+        return items
+
+    def iter_from(self, iter_: Iterable[ImageItem]) -> Iterator[ImageItem]:
+        if not self.max_workers:
+            items = []
+            for item in iter_:
+                items.append(item)
+                if len(items) >= self.batch_size:
+                    yield from self._tag_batch(items)
+                    items = []
+            if items:
+                yield from self._tag_batch(items)
+            return
+
+        # preprocessing and inference release the GIL inside PIL/onnxruntime,
+        # so batches tagged on worker threads overlap with pulling (and thus
+        # decoding/downloading) the next items from the upstream source
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            items = []
+            for item in iter_:
+                items.append(item)
+                if len(items) >= self.batch_size:
+                    pending.append(executor.submit(self._tag_batch, items))
+                    items = []
+                    while len(pending) > self.max_workers:
+                        yield from pending.popleft().result()
+            if items:
+                pending.append(executor.submit(self._tag_batch, items))
+            while pending:
+                yield from pending.popleft().result()
+
+    def process(self, item: ImageItem) -> ImageItem:
+        if 'tags' in item.meta and not self.force:
+            return item
+        else:
+            tags, = self.method(images=[item.image], **self.kwargs)
+            return ImageItem(item.image, {**item.meta, 'tags': tags})
+
+
 class TagFilterAction(BaseAction):
     # noinspection PyShadowingBuiltins
     def __init__(self, tags: Union[List[str], Mapping[str, float]],
@@ -84,21 +432,23 @@ class TagFilterAction(BaseAction):
             self.tags = dict(tags)
         else:
             raise TypeError(f'Unknown type of tags - {tags!r}.')
+        # flat tuple keeps the per-image loop free of dict-view overhead
+        self._tag_items = tuple(self.tags.items())
         self.tagger = TaggingAction(method, force=False, **kwargs)
         self.reversed = reversed
 
     def iter(self, item: ImageItem) -> Iterator[ImageItem]:
-        item = self.tagger(item)
-        tags = item.meta['tags']
-
-        valid = True
-        for tag, min_score in self.tags.items():
-            tag_score = tags.get(tag, 0.0)
-            if (not self.reversed and tag_score < min_score) or \
-                    (self.reversed and tag_score > min_score):
-                valid = False
-                break
-
+        # the tagger is a no-op on already-tagged items (force=False), so
+        # judge on the existing metadata without dispatching to it at all
+        tags = item.meta.get('tags')
+        if tags is None:
+            item = self.tagger(item)
+            tags = item.meta['tags']
+
+        if self.reversed:
+            valid = all(tags.get(tag, 0.0) <= min_score for tag, min_score in self._tag_items)
+        else:
+            valid = all(tags.get(tag, 0.0) >= min_score for tag, min_score in self._tag_items)
         if valid:
             yield item
 
@@ -106,10 +456,22 @@ class TagFilterAction(BaseAction):
         self.tagger.reset()
 
 
-class TagOverlapDropAction(ProcessAction):
-    def process(self, item: ImageItem) -> ImageItem:
-        tags = drop_overlap_tags(dict(item.meta.get('tags') or {}))
-        return ImageItem(item.image, {**item.meta, 'tags': tags})
+# imgutils matches blacklist entries on word-set combinations rather than
+# literal tags, so the blacklist cannot be flattened into a frozenset; since
+# tag vocabularies repeat heavily across a dataset, memoizing per distinct tag
+# makes repeated lookups O(1) anyway
+_cached_is_blacklisted = lru_cache(maxsize=65536)(is_blacklisted)
+
+# the distinct tag vocabulary is small compared to the number of images, so
+# memoizing the string rewrite amortizes it to a dict lookup
+_cached_remove_underline = lru_cache(maxsize=32768)(remove_underline)
+
+
+def _replace_tags(item: ImageItem, tags: dict) -> ImageItem:
+    meta = dict(item.meta)
+    meta['tags'] = tags
+    return ImageItem(item.image, meta)
+
 
 class DanbooruMetaProcessAction(ProcessAction):
     def __init__(self, meta_whitelist: List[str], output_dir: str):
@@ -164,66 +526,125 @@ class DanbooruTagProcessAction(ProcessAction):
             if rating == "q":
                 tags["nsfw"] = 0
             # Drop meta tags, sort desc whitelisted
-            for meta_tag in meta.split():
-                if meta_tag in self.meta_whitelist:
-                    tags[meta_tag] = 0
-                elif tags.get(meta_tag):
+            meta_set = set(meta.split())
+            tags.update(dict.fromkeys(meta_set & self.meta_whitelist, 0))
+            for meta_tag in meta_set - self.meta_whitelist:
+                if tags.get(meta_tag):
                     del tags[meta_tag]
             # Sort asc characters copyrights and artists
-            for character in characters.split():
-                tags[character] = 2.9
-            for copyright in copyrights.split():
-                tags[copyright] = 2.8
-            # pre-pend '@:' for artist tags
+            tags.update(dict.fromkeys(characters.split(), 2.9))
+            tags.update(dict.fromkeys(copyrights.split(), 2.8))
+            # pre-pend '@' for artist tags, dropping the plain artist tag the
+            # source put into meta['tags'] from the full tag_string
             for artist in artists.split():
-                tags[artist] = 2.7
-                by_artist = '@' + artist
-                tags[by_artist] = tags[artist]
-                del tags[artist]
-        return ImageItem(item.image, {**item.meta, 'tags': tags})
+                tags.pop(artist, None)
+                tags['@' + artist] = 2.7
+        return _replace_tags(item, tags)
+
+def _apply_rating(item: ImageItem, rating: str, score: float) -> ImageItem:
+    # Tag r15 as "nsfw"
+    if rating == 'r15':
+        return _replace_tags(item, {**(item.meta.get('tags') or {}), 'nsfw': score})
+    # Tag r18 as "explicit"
+    if rating == 'r18':
+        return _replace_tags(item, {**(item.meta.get('tags') or {}), 'explicit': score})
+    return item
+
 
 class TagNSFWOrExplicitAction(ProcessAction):
+    def __init__(self, device: str = 'auto'):
+        self.device = device
+
     def process(self, item: ImageItem) -> ImageItem:
-        [rating, score] = anime_rating(item.image)
-        tags = dict(item.meta.get('tags') or {})
-        # Tag r15 as "nsfw"
-        if rating == 'r15':
-            tags["nsfw"] = score
-        # Tag r18 as "explicit"
-        if rating == 'r18':
-            tags["explicit"] = score
-        return ImageItem(item.image, {**item.meta, 'tags': tags})
+        (rating, score), = _batch_rating([item.image], self.device)
+        return _apply_rating(item, rating, score)
+
+
+class BatchTagNSFWOrExplicitAction(ProcessAction):
+    def __init__(self, batch_size: int = 8, device: str = 'auto'):
+        self.batch_size = batch_size
+        self.device = device
+
+    def _rate_batch(self, items: List[ImageItem]) -> List[ImageItem]:
+        ratings = _batch_rating([item.image for item in items], self.device)
+        return [_apply_rating(item, rating, score) for item, (rating, score) in zip(items, ratings)]
+
+    def iter_from(self, iter_: Iterable[ImageItem]) -> Iterator[ImageItem]:
+        items = []
+        for item in iter_:
+            items.append(item)
+            if len(items) >= self.batch_size:
+                yield from self._rate_batch(items)
+                items = []
+        if items:
+            yield from self._rate_batch(items)
+
+    def process(self, item: ImageItem) -> ImageItem:
+        (rating, score), = _batch_rating([item.image], self.device)
+        return _apply_rating(item, rating, score)
 
 QUALITY_TAGS = ["absurdres", "masterpiece", "best quality", "very aesthetic", "aesthetic", "low quality", "worst quality"]
 
 class SortQualityRatingsAction(ProcessAction):
     def process(self, item: ImageItem) -> ImageItem:
-        tags = dict(item.meta.get('tags') or {})
+        tags = item.meta.get('tags') or {}
+        updates = {quality: i * 0.0001 for i, quality in enumerate(reversed(QUALITY_TAGS)) if quality in tags}
+        if not updates:
+            return item
+        return _replace_tags(item, {**tags, **updates})
+
+class TagPostprocessAction(ProcessAction):
+    def __init__(self, drop_overlap: bool = False, drop_blacklisted: bool = False,
+                 remove_underline: bool = False, drop_tags: Iterable[str] = ()):
+        self.drop_overlap = drop_overlap
+        self.drop_blacklisted = drop_blacklisted
+        self.remove_underline = remove_underline
+        self.drop_tags = frozenset(drop_tags)
+        if drop_blacklisted:
+            # force the blacklist download/parse at construction instead of on the first item
+            _cached_is_blacklisted('solo')
+
+    def process(self, item: ImageItem) -> ImageItem:
+        tags = item.meta.get('tags') or {}
+        changed = False
+        if self.drop_overlap:
+            dropped = drop_overlap_tags(tags)
+            changed = len(dropped) != len(tags)
+            tags = dropped
+
+        # all remaining filters and rewrites happen in one walk over the tags
+        new_tags = {}
         for tag, score in tags.items():
-            for i, quality in enumerate(reversed(QUALITY_TAGS)):
-                if quality == tag:
-                    tags[quality] = i * 0.0001
-        return ImageItem(item.image, {**item.meta, 'tags': tags})
+            if tag in self.drop_tags or (self.drop_blacklisted and _cached_is_blacklisted(tag)):
+                changed = True
+                continue
+            if self.remove_underline and '_' in tag:
+                tag = _cached_remove_underline(tag)
+                changed = True
+            # keep the highest score when two source tags collapse to one name
+            if tag not in new_tags or score > new_tags[tag]:
+                new_tags[tag] = score
+
+        if not changed:
+            return item
+        return _replace_tags(item, new_tags)
 
-class TagDropAction(ProcessAction):
-    def __init__(self, tags_to_drop: List[str]):
-        self.tags_to_drop = set(tags_to_drop)
 
-    def process(self, item: ImageItem) -> ImageItem:
-        tags = dict(item.meta.get('tags') or {})
-        tags = {tag: score for tag, score in tags.items() if tag not in self.tags_to_drop}
-        return ImageItem(item.image, {**item.meta, 'tags': tags})
+class TagOverlapDropAction(TagPostprocessAction):
+    def __init__(self):
+        super().__init__(drop_overlap=True)
 
 
-class BlacklistedTagDropAction(ProcessAction):
-    def process(self, item: ImageItem) -> ImageItem:
-        tags = dict(item.meta.get('tags') or {})
-        tags = {tag: score for tag, score in tags.items() if not is_blacklisted(tag)}
-        return ImageItem(item.image, {**item.meta, 'tags': tags})
+class TagDropAction(TagPostprocessAction):
+    def __init__(self, tags_to_drop: List[str]):
+        super().__init__(drop_tags=tags_to_drop)
 
 
-class TagRemoveUnderlineAction(ProcessAction):
-    def process(self, item: ImageItem) -> ImageItem:
-        tags = dict(item.meta.get('tags') or {})
-        tags = {remove_underline(tag): score for tag, score in tags.items()}
-        return ImageItem(item.image, {**item.meta, 'tags': tags})
+class BlacklistedTagDropAction(TagPostprocessAction):
+    def __init__(self):
+        super().__init__(drop_blacklisted=True)
+
+
+class TagRemoveUnderlineAction(TagPostprocessAction):
+    def __init__(self):
+        super().__init__(remove_underline=True)